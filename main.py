@@ -1,7 +1,23 @@
-import socket
-import threading
+import asyncio
+import functools
 import json
 import logging
+import logging.handlers
+import os
+import queue
+import signal
+import socket
+import struct
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional, fall back to the default event loop
+    uvloop = None
+
+try:
+    import resource
+except ImportError:  # Unix only
+    resource = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -9,15 +25,181 @@ logger = logging.getLogger(__name__)
 
 HOST = "0.0.0.0"  # Listen on all interfaces
 PORT = 5500       # Change if needed
+MAX_FRAME_SIZE = 64 * 1024  # Largest accepted inbound frame payload
+FLUSH_THRESHOLD = 16 * 1024  # Buffered bytes that trigger an immediate flush
+FLUSH_INTERVAL = 0.002  # Max seconds a frame waits in a send buffer to be coalesced
+WRITE_HIGH_WATER = 64 * 1024  # Transport backlog at which flushing to it pauses
+SEND_BUFFER_LIMIT = 512 * 1024  # Slow consumers are disconnected past this backlog
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # Kernel SO_SNDBUF/SO_RCVBUF per client
+TCP_QUICKACK = getattr(socket, "TCP_QUICKACK", None)  # Linux only
+# Worker processes sharing the port via SO_REUSEPORT, one per core this process
+# may run on. Fanout stays on each worker's event loop since transports are not
+# thread-safe, so the processes are what spread it across cores, with or without
+# a GIL. Only CPU affinity is honoured, not cgroup CPU quotas; set RELAY_WORKERS
+# to match a container's CPU limit. Workers are linked in a full mesh, so the
+# default is capped at MAX_DEFAULT_WORKERS.
+if hasattr(os, "process_cpu_count"):  # 3.13+
+    _usable_cpus = os.process_cpu_count()
+elif hasattr(os, "sched_getaffinity"):
+    _usable_cpus = len(os.sched_getaffinity(0))
+else:
+    _usable_cpus = os.cpu_count()
+MAX_DEFAULT_WORKERS = 16
+WORKERS = int(os.environ.get("RELAY_WORKERS", min(_usable_cpus or 1, MAX_DEFAULT_WORKERS)))
+PEER_BUFFER_LIMIT = 16 * 1024 * 1024  # Voice to another worker is shed past this backlog
+
+# Every message is framed as a 4-byte big-endian payload length followed by the
+# payload. The payload starts with an opcode byte, then fixed-size integer fields
+# and/or string fields, each a 1-byte length followed by UTF-8; voice text is the
+# raw remainder.
+FRAME_HEADER = struct.Struct(">I")
+FRAME_PREFIX = struct.Struct(">IB")  # Length and opcode packed together
+MAX_FIELD_SIZE = 255
+# Frames relayed between workers carry the sender's registered id in place of the
+# one it sent, so they can be longer than the client frame they came from
+PEER_MAX_FRAME_SIZE = MAX_FRAME_SIZE + 2 * (MAX_FIELD_SIZE + 1)
+
+# Voice frames sent to clients refer to players and languages by uint16 ids
+# instead of strings. Each client is told the id of every language (LANGUAGE) and
+# player (LANG_UPDATE) before a frame uses it; player id 0 is an unregistered sender.
+# Only registered players' languages get ids, so a frame spoken in any other
+# language carries it inline as a string field instead (TRANSLATE_INLINE/DIRECT_INLINE).
+IID = struct.Struct(">H")
+IID_PAIR = struct.Struct(">HH")
+DIRECT_HEADER = struct.Struct(">BHH")
+TRANSLATE_HEADER = struct.Struct(">BHHH")
+INLINE_DIRECT_HEADER = struct.Struct(">BH")
+INLINE_TRANSLATE_HEADER = struct.Struct(">BHH")
+MAX_IID = 0xFFFF
+MAX_LANGUAGES = 4096  # Bounds the table every new client is sent
+
+# Client -> server opcodes
+OP_REGISTER = 1  # player_id, language
+OP_LANG = 2  # player_id, language
+OP_VOICE = 3  # sender_id, sender_language + text
+
+# Server -> client opcodes
+OP_TRANSLATE = 4  # sender_iid, sender_language_iid, receiver_language_iid + text
+OP_DIRECT = 5  # sender_iid, sender_language_iid + text
+OP_LANG_UPDATE = 6  # player_iid, language_iid, player_id
+OP_LANGUAGE = 8  # language_iid, language
+OP_TRANSLATE_INLINE = 9  # sender_iid, receiver_language_iid, sender_language + text
+OP_DIRECT_INLINE = 10  # sender_iid, sender_language + text
+
+# Worker -> worker opcodes, REGISTER/LANG/VOICE are also relayed between workers
+OP_UNREGISTER = 7  # player_id
+
+def encode_fields(*fields):
+    """Encode strings as consecutive length-prefixed UTF-8 fields"""
+    out = bytearray()
+    for field in fields:
+        data = field.encode("utf-8")
+        if len(data) > MAX_FIELD_SIZE:
+            raise ValueError(f"Field too long: {len(data)} bytes")
+        out.append(len(data))
+        out += data
+    return bytes(out)
+
+def decode_fields(data, count):
+    """Decode count length-prefixed fields, returning them and a view of the remaining bytes"""
+    fields = []
+    offset = 0
+    for _ in range(count):
+        end = offset + 1 + data[offset]
+        if end > len(data):
+            raise ValueError("Truncated field")
+        fields.append(str(data[offset + 1:end], "utf-8"))
+        offset = end
+    return fields, data[offset:]
+
+@functools.lru_cache(maxsize=1024)
+def base_language(language):
+    """Extract base language (e.g., "english" from "English (US)")"""
+    if not language:
+        return None
+    return language.split(" ", 1)[0].lower()
+
+def encode_frame(opcode, body):
+    """Encode a complete frame for an opcode and its encoded body"""
+    return FRAME_PREFIX.pack(len(body) + 1, opcode) + body
 
 class ClientInfo:
     """Store client information"""
-    def __init__(self, socket, addr):
-        self.socket = socket
+    def __init__(self, transport, addr, max_frame_size=MAX_FRAME_SIZE):
+        self.transport = transport
         self.addr = addr
         self.player_id = None
+        self.iid = 0  # Wire id of a registered player
         self.language = None
+        self.language_iid = 0
+        self.base_language = None  # e.g. "english" for "English (US)"
         self.connected = True
+        self.sendbuf = []  # Pending frame parts, flushed as one scatter write
+        self.sendbuf_size = 0
+        self.flush_handle = None  # Pending FLUSH_INTERVAL timer, if any
+        self.write_paused = False  # Transport is above WRITE_HIGH_WATER
+        # Preallocated receive buffer that the transport reads straight into;
+        # rxbuf[:rx_end] holds bytes not yet consumed as complete frames, and it
+        # always fits one whole frame
+        self.max_frame_size = max_frame_size
+        self.rxbuf = bytearray(FRAME_HEADER.size + max_frame_size if transport is not None else 0)
+        self.rxview = memoryview(self.rxbuf)
+        self.rx_end = 0
+        self.send_limit = SEND_BUFFER_LIMIT
+        self.send_allowance = 0  # Extra backlog allowed while the initial player list drains
+        self.peer = None  # For players on another worker, the link to that worker
+        self.worker_link = False  # Link to another worker rather than a client
+        self.voice_dropped = 0  # Voice frames shed while a worker link is backed up
+
+class ClientProtocol(asyncio.BufferedProtocol):
+    """Forward a client connection's transport events to the relay server"""
+    def __init__(self, server):
+        self.server = server
+        self.client_info = None
+    
+    def connection_made(self, transport):
+        self.client_info = self.server._on_conn(transport)
+    
+    def get_buffer(self, sizehint):
+        return self.client_info.rxview[self.client_info.rx_end:]
+    
+    def buffer_updated(self, nbytes):
+        self.server._on_client_data(self.client_info, nbytes)
+    
+    def connection_lost(self, exc):
+        if exc is not None:
+            logger.error("Client %s error: %s", self.client_info.addr, exc)
+        self.server.disconnect_client(self.client_info)
+    
+    def pause_writing(self):
+        self.client_info.write_paused = True
+    
+    def resume_writing(self):
+        self.server._resume_writing(self.client_info)
+
+class PeerProtocol(asyncio.BufferedProtocol):
+    """Forward events from a link to another worker process to the relay server"""
+    def __init__(self, server):
+        self.server = server
+        self.peer_info = None
+    
+    def connection_made(self, transport):
+        self.peer_info = self.server._on_peer(transport)
+    
+    def get_buffer(self, sizehint):
+        return self.peer_info.rxview[self.peer_info.rx_end:]
+    
+    def buffer_updated(self, nbytes):
+        self.server._on_data(self.peer_info, nbytes, self.server._peer_handlers)
+    
+    def connection_lost(self, exc):
+        self.server._on_peer_lost(self.peer_info, exc)
+    
+    def pause_writing(self):
+        self.peer_info.write_paused = True
+    
+    def resume_writing(self):
+        self.server._resume_writing(self.peer_info)
 
 class VoiceRelayServer:
     """
@@ -26,37 +208,65 @@ class VoiceRelayServer:
     def __init__(self, host=HOST, port=PORT):
         self.host = host
         self.port = port
-        self.clients = {}  # socket -> ClientInfo mapping
+        # All client state is only touched from the event loop thread, so plain
+        # dicts are safe without locking
+        self.clients = {}  # transport -> ClientInfo mapping
         self.player_clients = {}  # player_id -> ClientInfo mapping
-        self.server_socket = None
+        # Immutable copy of the registered clients, rebuilt on register/disconnect.
+        # Broadcast paths iterate it so clients dropping mid-broadcast cannot
+        # mutate what is being iterated.
+        self._snapshot = ()
+        # Registered clients grouped by language, rebuilt along with the snapshot
+        # and whenever a registered client changes language
+        self._by_lang = {}  # language -> tuple of ClientInfo
+        self.remote_players = {}  # player_id -> ClientInfo for players on other workers
+        self.peers = []  # ClientInfo for each link to another worker
+        self.peer_sockets = []  # Connected sockets to other workers, set before start()
+        self.worker_id = 0
+        self.worker_pids = []  # Forked workers, only set in the first worker
+        self.reuse_port = False
+        self._hdr_cache = {}  # (sender_iid, sender_language, receiver_language) -> encoded header
+        self._next_iid = 1
+        self._free_iids = []  # Player ids released by players that left
+        self._language_iids = {}  # language -> wire id, for languages players use
+        self._language_refs = {}  # language -> number of players using it
+        self._next_language_iid = 1
+        self._free_language_iids = []  # Ids of languages nobody uses any more
+        self.server = None
+        self.loop = None
         self.running = False
+        self._handlers = {
+            OP_REGISTER: self._on_register,
+            OP_LANG: self._on_lang,
+            OP_VOICE: self._on_voice,
+        }
+        self._peer_handlers = {
+            OP_REGISTER: self._on_peer_register,
+            OP_LANG: self._on_peer_lang,
+            OP_VOICE: self._on_peer_voice,
+            OP_UNREGISTER: self._on_peer_unregister,
+        }
         
-    def start(self):
+    async def start(self):
         """Start the relay server"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen()
+        # Connections are served by protocol callbacks on a single readiness-based
+        # event loop (epoll/kqueue), with no per-client thread or coroutine
+        self.loop = asyncio.get_running_loop()
+        self.server = await self.loop.create_server(
+            lambda: ClientProtocol(self), self.host, self.port, reuse_port=self.reuse_port or None)
+        for sock in self.peer_sockets:
+            await self.loop.connect_accepted_socket(lambda: PeerProtocol(self), sock)
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, self.server.close)
+        except NotImplementedError:
+            pass  # No signal handlers on this platform
         self.running = True
         
-        logger.info(f"Voice relay server listening on {self.host}:{self.port}")
+        logger.info("Voice relay server worker %s listening on %s:%s", self.worker_id, self.host, self.port)
         
         try:
-            while self.running:
-                client_sock, addr = self.server_socket.accept()
-                client_info = ClientInfo(client_sock, addr)
-                self.clients[client_sock] = client_info
-                
-                # Start client handler thread
-                threading.Thread(
-                    target=self.handle_client, 
-                    args=(client_info,), 
-                    daemon=True
-                ).start()
-                
-                logger.info(f"Client connected: {addr}")
-                
-        except KeyboardInterrupt:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
             logger.info("Server shutting down...")
         finally:
             self.stop()
@@ -64,177 +274,588 @@ class VoiceRelayServer:
     def stop(self):
         """Stop the relay server"""
         self.running = False
-        if self.server_socket:
-            self.server_socket.close()
+        if self.server:
+            self.server.close()
         
         # Close all client connections
         for client_info in list(self.clients.values()):
             self.disconnect_client(client_info)
+        for peer_info in list(self.peers):
+            peer_info.transport.close()
     
     def disconnect_client(self, client_info):
         """Disconnect a client and cleanup"""
         try:
             client_info.connected = False
-            if client_info.socket in self.clients:
-                del self.clients[client_info.socket]
-            if client_info.player_id and client_info.player_id in self.player_clients:
+            if client_info.flush_handle is not None:
+                client_info.flush_handle.cancel()
+                client_info.flush_handle = None
+            client_info.transport.close()
+            if client_info.transport not in self.clients:
+                return  # Already cleaned up
+            del self.clients[client_info.transport]
+            if client_info.player_id and self.player_clients.get(client_info.player_id) is client_info:
                 del self.player_clients[client_info.player_id]
-            client_info.socket.close()
-            logger.info(f"Client disconnected: {client_info.addr}")
+                self._rebuild_snapshot()
+                self._publish(OP_UNREGISTER, encode_fields(client_info.player_id))
+            self._release_iid(client_info)
+            logger.info("Client disconnected: %s", client_info.addr)
         except Exception as e:
-            logger.error(f"Error disconnecting client {client_info.addr}: {e}")
+            logger.error("Error disconnecting client %s: %s", client_info.addr, e)
     
-    def needs_translation(self, sender_language, receiver_language):
-        """Check if translation is needed between two languages"""
-        if not sender_language or not receiver_language:
-            return True
+    def _rebuild_snapshot(self):
+        """Refresh the tuple of registered clients and the language index used by broadcasts"""
+        self._snapshot = tuple(self.player_clients.values())
+        by_lang = {}
+        for client_info in self._snapshot:
+            by_lang.setdefault(client_info.language, []).append(client_info)
+        self._by_lang = {language: tuple(group) for language, group in by_lang.items()}
+    
+    def _assign_iid(self, client_info):
+        """Give a player a wire id, reusing ids of players that left"""
+        if client_info.iid:
+            return
+        if self._free_iids:
+            client_info.iid = self._free_iids.pop()
+        elif self._next_iid <= MAX_IID:
+            client_info.iid = self._next_iid
+            self._next_iid += 1
+        else:
+            raise ValueError("No free player ids")
+    
+    def _release_iid(self, client_info):
+        """Return a departed player's wire id, and its language's once unused, for reuse"""
+        if client_info.iid:
+            self._invalidate_headers(client_info.iid)
+            self._free_iids.append(client_info.iid)
+            client_info.iid = 0
+        self._release_language(client_info.language)
+        client_info.language = client_info.base_language = None
+        client_info.language_iid = 0
+    
+    def _language_iid(self, language):
+        """Return the wire id for a language, announcing new ones to every client"""
+        language_iid = self._language_iids.get(language)
+        if language_iid is None:
+            if self._free_language_iids:
+                language_iid = self._free_language_iids.pop()
+            elif self._next_language_iid <= MAX_LANGUAGES:
+                language_iid = self._next_language_iid
+                self._next_language_iid += 1
+            else:
+                raise ValueError("Language table full")
+            self._language_iids[language] = language_iid
+            
+            frame = encode_frame(OP_LANGUAGE, IID.pack(language_iid) + encode_fields(language))
+            for client_info in self._snapshot:
+                if client_info.connected:
+                    self._enqueue(client_info, frame)
+        return language_iid
+    
+    def set_language(self, client_info, language):
+        """Update a client's language and its cached base language"""
+        if language == client_info.language:
+            return
         
-        # Extract base language (e.g., "English" from "English (US)")
-        sender_base = sender_language.split(" ")[0].lower()
-        receiver_base = receiver_language.split(" ")[0].lower()
+        client_info.language_iid = self._language_iid(language)
+        self._language_refs[language] = self._language_refs.get(language, 0) + 1
+        self._release_language(client_info.language)
+        client_info.language = language
+        client_info.base_language = base_language(language)
+        if client_info.iid:
+            self._invalidate_headers(client_info.iid)
+        if client_info.player_id and self.player_clients.get(client_info.player_id) is client_info:
+            self._rebuild_snapshot()
+    
+    def _release_language(self, language):
+        """Drop one player's use of a language, freeing its wire id when it was the last"""
+        if language is None:
+            return
+        refs = self._language_refs[language] - 1
+        if refs:
+            self._language_refs[language] = refs
+            return
+        # Clients learn the id's next language before any frame refers to it
+        del self._language_refs[language]
+        self._free_language_iids.append(self._language_iids.pop(language))
+        stale = [key for key in self._hdr_cache if language in (key[1], key[2])]
+        for key in stale:
+            del self._hdr_cache[key]
+    
+    def needs_translation(self, sender_base, receiver_base):
+        """Check if translation is needed between two base languages"""
+        if not sender_base or not receiver_base:
+            return True
         
         return sender_base != receiver_base
     
-    def route_voice_message(self, sender_info, sender_language, original_text):
-        """Route voice message to appropriate clients with language-aware routing"""
-        for client_info in self.clients.values():
-            if client_info == sender_info or not client_info.connected:
-                continue  # Skip sender and disconnected clients
-            
-            try:
-                # Determine if translation is needed
-                if self.needs_translation(sender_language, client_info.language):
+    def _invalidate_headers(self, iid):
+        """Drop cached routing headers for messages sent by a player"""
+        stale = [key for key in self._hdr_cache if key[0] == iid]
+        for key in stale:
+            del self._hdr_cache[key]
+    
+    def _routing_header(self, sender_info, sender_language, receiver_info):
+        """Return the encoded TRANSLATE/DIRECT payload prefix for a sender/receiver pair"""
+        key = (sender_info.iid, sender_language, receiver_info.language)
+        header = self._hdr_cache.get(key)
+        if header is None:
+            # Decided by the language the frame was spoken in, which is not
+            # always the sender's registered one
+            translate = self.needs_translation(base_language(sender_language), receiver_info.base_language)
+            if sender_language == sender_info.language:
+                if translate:
                     # Different languages - send for translation
-                    message = f"TRANSLATE:{sender_info.player_id}|{sender_language}|{client_info.language}|{original_text}"
+                    header = TRANSLATE_HEADER.pack(
+                        OP_TRANSLATE, sender_info.iid, sender_info.language_iid, receiver_info.language_iid)
                 else:
                     # Same language - send original directly
-                    message = f"DIRECT:{sender_info.player_id}|{sender_language}|{original_text}"
-                
-                client_info.socket.sendall(message.encode("utf-8"))
-                logger.debug(f"Routed message from {sender_info.player_id} to {client_info.player_id}")
-                
-            except Exception as e:
-                logger.error(f"Error routing message to {client_info.addr}: {e}")
-                self.disconnect_client(client_info)
+                    header = DIRECT_HEADER.pack(OP_DIRECT, sender_info.iid, sender_info.language_iid)
+            else:
+                # Arbitrary languages in VOICE frames get no id, so they cannot fill
+                # the language table or flood clients with it; name them inline
+                language_field = encode_fields(sender_language)
+                if translate:
+                    header = INLINE_TRANSLATE_HEADER.pack(
+                        OP_TRANSLATE_INLINE, sender_info.iid, receiver_info.language_iid) + language_field
+                else:
+                    header = INLINE_DIRECT_HEADER.pack(OP_DIRECT_INLINE, sender_info.iid) + language_field
+            # Only cache the sender's registered language, so arbitrary languages
+            # in VOICE frames from other ids cannot grow the cache unbounded
+            if sender_info.iid and sender_language == sender_info.language:
+                self._hdr_cache[key] = header
+        return header
+    
+    def _configure_socket(self, sock):
+        """Tune an accepted client socket for small, latency-sensitive voice frames"""
+        # Send buffers are already coalesced in user space, so Nagle only adds delay
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    
+    def _enqueue(self, client_info, *parts):
+        """Append frame parts to a client's send buffer to be flushed shortly"""
+        size = client_info.sendbuf_size
+        for part in parts:
+            size += len(part)
+        limit = client_info.send_limit + client_info.send_allowance
+        if size + client_info.transport.get_write_buffer_size() > limit and not client_info.worker_link:
+            # Slow consumer - drop it rather than buffer unbounded voice backlog
+            logger.warning("Send buffer overflow for %s, disconnecting", client_info.addr)
+            client_info.transport.abort()
+            self.disconnect_client(client_info)
+            return
+        
+        was_empty = not client_info.sendbuf
+        client_info.sendbuf.extend(parts)
+        client_info.sendbuf_size = size
+        if size >= FLUSH_THRESHOLD:
+            self._flush(client_info)
+        elif was_empty:
+            # Give more frames a chance to coalesce before writing
+            client_info.flush_handle = self.loop.call_later(FLUSH_INTERVAL, self._flush, client_info)
+    
+    def _flush(self, client_info):
+        """Write a client's send buffer to its transport"""
+        if client_info.flush_handle is not None:
+            client_info.flush_handle.cancel()
+            client_info.flush_handle = None
+        if not client_info.connected or not client_info.sendbuf:
+            return
+        if client_info.write_paused:
+            # The peer is not keeping up; keep coalescing here until the transport
+            # drains instead of growing its buffer, _resume_writing flushes later
+            return
+        
+        # Hand the whole batch to the transport at once so it can go out
+        # as a single scatter/gather write without joining it here
+        parts, client_info.sendbuf = client_info.sendbuf, []
+        client_info.sendbuf_size = 0
+        try:
+            client_info.transport.writelines(parts)
+        except Exception as e:
+            logger.error("Error writing to %s: %s", client_info.addr, e)
+            self.disconnect_client(client_info)
+    
+    def _resume_writing(self, client_info):
+        """Flush what queued up while a transport was above its high-water mark"""
+        client_info.write_paused = False
+        client_info.send_allowance = 0  # Anything written before this has drained
+        self._flush(client_info)
     
-    def broadcast_language_update(self, updated_player_id, language):
-        """Broadcast language preference update to all clients"""
-        message = f"LANG_UPDATE:{updated_player_id}|{language}"
-        for client_info in self.clients.values():
-            if client_info.connected and client_info.player_id != updated_player_id:
+    def route_voice_message(self, sender_info, sender_language, body):
+        """Route voice message to appropriate clients with language-aware routing"""
+        debug = logger.isEnabledFor(logging.DEBUG)
+        # Recipients sharing a language get an identical frame, so build it once per language
+        for group in self._by_lang.values():
+            if len(group) == 1 and group[0] is sender_info:
+                continue
+            header = self._routing_header(sender_info, sender_language, group[0])
+            length = FRAME_HEADER.pack(len(header) + len(body))
+            for client_info in group:
+                if client_info is sender_info or not client_info.connected:
+                    continue  # Skip sender and disconnected clients
                 try:
-                    client_info.socket.sendall(message.encode("utf-8"))
+                    self._enqueue(client_info, length, header, body)
+                    if debug:
+                        logger.debug("Routed message from %s to %s", sender_info.player_id, client_info.player_id)
+                    
                 except Exception as e:
-                    logger.error(f"Error broadcasting language update to {client_info.addr}: {e}")
+                    logger.error("Error routing message to %s: %s", client_info.addr, e)
                     self.disconnect_client(client_info)
     
-    def handle_client(self, client_info):
-        """Handle messages from a client"""
-        try:
-            while client_info.connected and self.running:
-                data = client_info.socket.recv(4096)
-                if not data:
-                    break
-                
+    def broadcast_language_update(self, player_info):
+        """Broadcast a player's id and language preference to all other clients"""
+        frame = encode_frame(OP_LANG_UPDATE, self._player_entry(player_info))
+        for client_info in self._snapshot:
+            if client_info.connected and client_info is not player_info:
                 try:
-                    message = data.decode("utf-8")
-                    self.process_message(client_info, message)
+                    self._enqueue(client_info, frame)
                 except Exception as e:
-                    logger.error(f"Error processing message from {client_info.addr}: {e}")
-                    
-        except Exception as e:
-            logger.error(f"Client {client_info.addr} error: {e}")
-        finally:
-            self.disconnect_client(client_info)
+                    logger.error("Error broadcasting language update to %s: %s", client_info.addr, e)
+                    self.disconnect_client(client_info)
     
-    def process_message(self, client_info, message):
-        """Process different types of messages from clients"""
-        
-        if message.startswith("REGISTER:"):
-            # Register client: "REGISTER:player_id|language"
-            try:
-                _, data = message.split(":", 1)
-                player_id, language = data.split("|", 1)
-                
-                client_info.player_id = player_id
-                client_info.language = language
-                self.player_clients[player_id] = client_info
-                
-                logger.info(f"Registered client {player_id} with language {language}")
-                
-                # Broadcast language to other clients
-                self.broadcast_language_update(player_id, language)
-                
-                # Send current player list to new client
-                self.send_player_list(client_info)
-                
-            except Exception as e:
-                logger.error(f"Error processing REGISTER: {e}")
+    def _on_conn(self, transport):
+        """Set up state for a newly accepted client"""
+        client_info = ClientInfo(transport, transport.get_extra_info("peername"))
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+        try:
+            self._configure_socket(transport.get_extra_info("socket"))
+        except OSError as e:
+            logger.warning("Could not tune socket for %s: %s", client_info.addr, e)
+        self.clients[transport] = client_info
+        logger.info("Client connected: %s", client_info.addr)
+        return client_info
+    
+    def _on_client_data(self, client_info, nbytes):
+        """Handle bytes received from a client"""
+        if TCP_QUICKACK is not None and client_info.connected:
+            # Quick-ack mode is reset by the kernel, re-arm it after every read
+            client_info.transport.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, TCP_QUICKACK, 1)
+        self._on_data(client_info, nbytes, self._handlers)
+    
+    def _on_data(self, client_info, nbytes, handlers):
+        """Process every complete frame after nbytes were read into the receive buffer"""
+        if not client_info.connected:
+            return
         
-        elif message.startswith("LANG:"):
-            # Language update: "LANG:player_id|language"
+        client_info.rx_end += nbytes
+        rx_end = client_info.rx_end
+        rxview = client_info.rxview
+        offset = 0
+        while rx_end - offset >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(rxview, offset)
+            if not 0 < length <= client_info.max_frame_size:
+                logger.error("Invalid frame length %s from %s", length, client_info.addr)
+                self.disconnect_client(client_info)
+                return
+            
+            end = offset + FRAME_HEADER.size + length
+            if end > rx_end:
+                break  # Wait for the rest of the frame
+            # The buffer is reused for the next read, so each frame gets its own
+            # copy that queued voice text can keep referring to
+            payload = bytes(rxview[offset + FRAME_HEADER.size:end])
+            offset = end
+            
             try:
-                _, data = message.split(":", 1)
-                player_id, language = data.split("|", 1)
-                
-                if client_info.player_id == player_id:
-                    client_info.language = language
-                    logger.info(f"Updated language for {player_id}: {language}")
-                    
-                    # Broadcast to other clients
-                    self.broadcast_language_update(player_id, language)
-                
+                self.process_message(client_info, payload, handlers)
             except Exception as e:
-                logger.error(f"Error processing LANG: {e}")
+                logger.error("Error processing message from %s: %s", client_info.addr, e)
+            if not client_info.connected:
+                return
         
-        elif message.startswith("VOICE:"):
-            # Voice message: "VOICE:sender_id|sender_language|text"
+        if offset:
+            # Move a trailing partial frame to the front of the buffer
+            remaining = rx_end - offset
+            client_info.rxbuf[:remaining] = rxview[offset:rx_end]
+            client_info.rx_end = remaining
+    
+    def process_message(self, client_info, payload, handlers=None):
+        """Dispatch a framed message from a client on its opcode byte"""
+        handler = (handlers or self._handlers).get(payload[0])
+        if handler is None:
+            logger.warning("Unknown opcode %s from %s", payload[0], client_info.addr)
+            return
+        # Handlers get a view of the body so fields and voice text are sliced
+        # out of the frame without copying
+        handler(client_info, memoryview(payload)[1:])
+    
+    def _on_register(self, client_info, data):
+        """Register client: player_id, language"""
+        try:
+            (player_id, language), _ = decode_fields(data, 2)
+            
+            had_iid = client_info.iid
+            self._assign_iid(client_info)
             try:
-                _, data = message.split(":", 1)
-                parts = data.split("|", 2)
-                if len(parts) == 3:
-                    sender_id, sender_language, text = parts
-                    
-                    # Update sender's language
-                    if client_info.player_id == sender_id:
-                        client_info.language = sender_language
-                    
-                    # Route to appropriate clients
-                    self.route_voice_message(client_info, sender_language, text)
+                self.set_language(client_info, language)
+            except Exception:
+                # Leave a client that could not register as it was
+                if not had_iid:
+                    self._release_iid(client_info)
+                raise
+            
+            if client_info.player_id and self.player_clients.get(client_info.player_id) is client_info:
+                # Re-registering under a new id replaces the old entry, the wire id is kept
+                del self.player_clients[client_info.player_id]
+                self._publish(OP_UNREGISTER, encode_fields(client_info.player_id))
+            
+            client_info.player_id = player_id
+            self.player_clients[player_id] = client_info
+            self._rebuild_snapshot()
+            
+            logger.info("Registered client %s with language %s", player_id, language)
+            self._publish(OP_REGISTER, data)
+            
+            # Broadcast language to other clients
+            self.broadcast_language_update(client_info)
+            
+            # Send current player list to new client
+            self.send_player_list(client_info)
+            
+        except Exception as e:
+            logger.error("Error processing REGISTER: %s", e)
+    
+    def _on_lang(self, client_info, data):
+        """Language update: player_id, language"""
+        try:
+            (player_id, language), _ = decode_fields(data, 2)
+            
+            if client_info.player_id == player_id:
+                self.set_language(client_info, language)
+                logger.info("Updated language for %s: %s", player_id, language)
+                self._publish(OP_LANG, data)
                 
-            except Exception as e:
-                logger.error(f"Error processing VOICE: {e}")
-        
-        else:
-            # Legacy format - treat as voice message
-            if "|" in message:
-                try:
-                    sender_id, text = message.split("|", 1)
-                    if client_info.player_id == sender_id and client_info.language:
-                        self.route_voice_message(client_info, client_info.language, text)
-                except Exception as e:
-                    logger.error(f"Error processing legacy message: {e}")
+                # Broadcast to other clients
+                self.broadcast_language_update(client_info)
+            
+        except Exception as e:
+            logger.error("Error processing LANG: %s", e)
+    
+    def _on_voice(self, client_info, data):
+        """Voice message: sender_id, sender_language + text"""
+        try:
+            (sender_id, sender_language), text = decode_fields(data, 2)
+            
+            # Update sender's language, announced like a LANG so every worker
+            # applies the same change
+            if client_info.player_id == sender_id and client_info.language != sender_language:
+                self.set_language(client_info, sender_language)
+                self._publish(OP_LANG, encode_fields(sender_id, sender_language))
+                self.broadcast_language_update(client_info)
+            
+            # Route to appropriate clients, the text is forwarded as-is
+            self.route_voice_message(client_info, sender_language, text)
+            if self.peers:
+                self._publish(OP_VOICE, encode_fields(client_info.player_id or "", sender_language), text)
+            
+        except Exception as e:
+            logger.error("Error processing VOICE: %s", e)
+    
+    def _on_peer(self, transport):
+        """Set up state for a link to another worker"""
+        peer_info = ClientInfo(transport, f"worker link {len(self.peers)}", PEER_MAX_FRAME_SIZE)
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+        peer_info.worker_link = True
+        peer_info.send_limit = PEER_BUFFER_LIMIT
+        self.peers.append(peer_info)
+        return peer_info
+    
+    def _on_peer_lost(self, peer_info, exc=None):
+        """Forget a worker link and every player that lived behind it"""
+        if exc is not None:
+            logger.error("Lost %s: %s", peer_info.addr, exc)
+        elif self.running:
+            # The other worker closed it, normally because it is shutting down
+            logger.info("%s closed", peer_info.addr)
+        self.disconnect_client(peer_info)
+        if peer_info in self.peers:
+            self.peers.remove(peer_info)
+        for player_id, remote_info in list(self.remote_players.items()):
+            if remote_info.peer is peer_info:
+                del self.remote_players[player_id]
+                self._release_iid(remote_info)
+    
+    def _publish(self, opcode, body, *tail):
+        """Relay an event to every other worker, tail parts are queued without copying"""
+        if not self.peers:
+            return
+        size = len(body) + 1
+        for part in tail:
+            size += len(part)
+        head = FRAME_PREFIX.pack(size, opcode) + body
+        size += FRAME_HEADER.size
+        for peer_info in self.peers:
+            if opcode == OP_VOICE:
+                backlog = peer_info.sendbuf_size + peer_info.transport.get_write_buffer_size()
+                if backlog + size > peer_info.send_limit:
+                    # Shed voice rather than cut the link, which would split the
+                    # workers for good; membership and language events always queue
+                    if not peer_info.voice_dropped:
+                        logger.warning("%s is backed up, dropping voice", peer_info.addr)
+                    peer_info.voice_dropped += 1
+                    continue
+                if peer_info.voice_dropped:
+                    logger.info("%s caught up after dropping %s voice frames",
+                                peer_info.addr, peer_info.voice_dropped)
+                    peer_info.voice_dropped = 0
+            self._enqueue(peer_info, head, *tail)
+    
+    def _on_peer_register(self, peer_info, data):
+        """A player registered on another worker: player_id, language"""
+        try:
+            (player_id, language), _ = decode_fields(data, 2)
+            existing = self.remote_players.get(player_id)
+            if existing is not None:
+                self._release_iid(existing)
+            
+            remote_info = ClientInfo(None, peer_info.addr)
+            remote_info.player_id = player_id
+            remote_info.peer = peer_info
+            self._assign_iid(remote_info)
+            self.set_language(remote_info, language)
+            self.remote_players[player_id] = remote_info
+            
+            self.broadcast_language_update(remote_info)
+        except Exception as e:
+            logger.error("Error processing peer REGISTER: %s", e)
+    
+    def _on_peer_lang(self, peer_info, data):
+        """A player on another worker changed language: player_id, language"""
+        try:
+            (player_id, language), _ = decode_fields(data, 2)
+            remote_info = self.remote_players.get(player_id)
+            if remote_info is not None:
+                self.set_language(remote_info, language)
+                self.broadcast_language_update(remote_info)
+        except Exception as e:
+            logger.error("Error processing peer LANG: %s", e)
+    
+    def _on_peer_voice(self, peer_info, data):
+        """A player on another worker spoke: sender_id, sender_language + text"""
+        try:
+            (sender_id, sender_language), text = decode_fields(data, 2)
+            remote_info = self.remote_players.get(sender_id)
+            if remote_info is None:
+                # Unregistered sender, route it the same way its own worker did
+                remote_info = ClientInfo(None, peer_info.addr)
+                remote_info.player_id = sender_id or None
+            
+            self.route_voice_message(remote_info, sender_language, text)
+        except Exception as e:
+            logger.error("Error processing peer VOICE: %s", e)
+    
+    def _on_peer_unregister(self, peer_info, data):
+        """A player left another worker: player_id"""
+        try:
+            (player_id,), _ = decode_fields(data, 1)
+            remote_info = self.remote_players.get(player_id)
+            if remote_info is not None and remote_info.peer is peer_info:
+                del self.remote_players[player_id]
+                self._release_iid(remote_info)
+        except Exception as e:
+            logger.error("Error processing peer UNREGISTER: %s", e)
+    
+    def _player_entry(self, player_info):
+        """Encode the LANG_UPDATE body announcing a player's wire id and language"""
+        return IID_PAIR.pack(player_info.iid, player_info.language_iid) + encode_fields(player_info.player_id)
     
     def send_player_list(self, client_info):
-        """Send current player list to a client"""
+        """Send the language table and current player list to a client"""
         try:
-            for player_id, player_client in self.player_clients.items():
-                if player_id != client_info.player_id and player_client.language:
-                    message = f"LANG_UPDATE:{player_id}|{player_client.language}"
-                    client_info.socket.sendall(message.encode("utf-8"))
+            # Coalesce the whole list into a single buffer and write
+            frames = bytearray()
+            for language, language_iid in self._language_iids.items():
+                frames += encode_frame(OP_LANGUAGE, IID.pack(language_iid) + encode_fields(language))
+            for player_client in self._snapshot + tuple(self.remote_players.values()):
+                if player_client is not client_info and player_client.language:
+                    frames += encode_frame(OP_LANG_UPDATE, self._player_entry(player_client))
+            if frames:
+                # The table grows with players and languages and can pass the slow
+                # consumer limit by itself, so it does not count against that limit
+                client_info.send_allowance = len(frames)
+                # Not touched again after this, so it is queued without a copy
+                self._enqueue(client_info, frames)
         except Exception as e:
-            logger.error(f"Error sending player list to {client_info.addr}: {e}")
+            logger.error("Error sending player list to %s: %s", client_info.addr, e)
 
 # Global server instance
 relay_server = VoiceRelayServer()
 
+def spawn_workers(server, workers):
+    """Fork worker processes sharing the listening port, linked by socket pairs.
+    
+    Returns in every process after configuring server for that worker.
+    """
+    if workers > 1 and not (hasattr(socket, "SO_REUSEPORT") and hasattr(os, "fork")):
+        logger.warning("SO_REUSEPORT or fork unavailable, running a single worker")
+        workers = 1
+    if workers <= 1:
+        return
+    
+    # The mesh is opened here before forking, two descriptors per pair of workers
+    needed = workers * (workers - 1) + 64  # Headroom for stdio and the listener
+    if resource is not None:
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft_limit != resource.RLIM_INFINITY and needed > soft_limit:
+            raise SystemExit(
+                f"{workers} workers need about {needed} open files to link them, over the "
+                f"limit of {soft_limit}; lower RELAY_WORKERS or raise the open file limit")
+    
+    # Full mesh of links so every worker can relay events to every other one
+    links = [[None] * workers for _ in range(workers)]
+    for i in range(workers):
+        for j in range(i + 1, workers):
+            links[i][j], links[j][i] = socket.socketpair()
+    
+    worker_id = 0
+    for i in range(1, workers):
+        pid = os.fork()
+        if pid == 0:
+            worker_id = i
+            server.worker_pids = []
+            break
+        server.worker_pids.append(pid)
+    
+    for i in range(workers):
+        for j in range(workers):
+            if links[i][j] is not None and i != worker_id:
+                links[i][j].close()
+    
+    server.worker_id = worker_id
+    server.reuse_port = True
+    server.peer_sockets = [sock for sock in links[worker_id] if sock is not None]
+
+def start_log_listener():
+    """Hand log records to a listener thread so writing them never blocks the event loop"""
+    root = logging.getLogger()
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    return listener
+
 def main():
+    spawn_workers(relay_server, WORKERS)
+    # Set up after forking, threads do not survive fork()
+    log_listener = start_log_listener()
+    if uvloop is not None:
+        uvloop.install()
     try:
-        relay_server.start()
+        asyncio.run(relay_server.start())
     except KeyboardInterrupt:
         logger.info("Server shutting down...")
     finally:
         relay_server.stop()
+        for pid in relay_server.worker_pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in relay_server.worker_pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass  # Already reaped
+        log_listener.stop()
 
 if __name__ == "__main__":
     main()